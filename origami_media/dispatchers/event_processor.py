@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Optional, cast
+from typing import TYPE_CHECKING, Optional
 
 from maubot.matrix import MaubotMessageEvent
 
@@ -25,13 +25,23 @@ class EventProcessor:
     def __init__(self, url_handler: "UrlHandler", config: "Config"):
         self.url_handler = url_handler
         self.config = config
-        self.command_prefix = self.config.command.get("command_prefix", "!")
+        self.reload()
 
-    def handle_passive(self, event: MaubotMessageEvent) -> Optional[CommandPacket]:
-        if not self.config.meta.get("enable_passive_url_detection", False):
+    def reload(self) -> None:
+        # Checked on every room message, snapshotted per config load.
+        self.command_prefix = self.config.command.get("command_prefix", "!")
+        self.enable_passive_url_detection = self.config.meta.get(
+            "enable_passive_url_detection", False
+        )
+        self.enable_commands = self.config.meta.get("enable_commands", False)
+
+    def handle_passive(
+        self, event: MaubotMessageEvent, body: str
+    ) -> Optional[CommandPacket]:
+        if not self.enable_passive_url_detection:
             return
 
-        if "http" not in event.content.body:
+        if "http" not in body or not self.url_handler.quick_has_valid(body):
             return
 
         command = BASE_COMMANDS.get("get")
@@ -40,11 +50,12 @@ class EventProcessor:
 
         return CommandPacket(command=command, event=event, user_args="")
 
-    def handle_active(self, event: MaubotMessageEvent) -> Optional[CommandPacket]:
-        if not self.config.meta.get("enable_commands", False):
+    def handle_active(
+        self, event: MaubotMessageEvent, body: str
+    ) -> Optional[CommandPacket]:
+        if not self.enable_commands:
             return None
 
-        body = cast(str, event.content.body)
         if not body.strip():
             return None
 
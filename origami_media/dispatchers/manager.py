@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import asyncio
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Set
 
 from origami_media.workers.preprocess_worker import PreprocessWorker
 from origami_media.workers.process_worker import ProcessWorker
@@ -29,45 +29,46 @@ class Manager:
         self.command_handler = command_handler
 
         self.ROUTE_EXECUTION_TIMEOUT = 350
-        self.preprocess_tasks = set()
-        self.preprocess_lock = asyncio.Lock()
+        self.pipeline_tasks: Set[asyncio.Task] = set()
 
-        self.event_queue = asyncio.Queue(
-            self.config.queue.get("event_queue_capacity", 10)
-        )
-
-        self.preprocess_worker = PreprocessWorker(
+        self.process_worker = ProcessWorker(
             log=self.log,
             config=self.config,
-            preprocess_lock=self.preprocess_lock,
-            preprocess_tasks=self.preprocess_tasks,
+            client=self.client,
+            process_semaphore=asyncio.Semaphore(
+                self.config.queue.get("process_worker_count", 1)
+            ),
+            ROUTE_EXECUTION_TIMEOUT=self.ROUTE_EXECUTION_TIMEOUT,
             command_handler=self.command_handler,
-            event_queue=self.event_queue,
         )
 
-        self._process_worker = ProcessWorker(
+        self.preprocess_worker = PreprocessWorker(
             log=self.log,
             config=self.config,
-            client=self.client,
-            event_queue=self.event_queue,
-            ROUTE_EXECUTION_TIMEOUT=self.ROUTE_EXECUTION_TIMEOUT,
+            preprocess_semaphore=asyncio.Semaphore(
+                self.config.queue.get("preprocess_worker_limit", 10)
+            ),
             command_handler=self.command_handler,
         )
 
-    async def spawn_process_workers(self) -> None:
-        self.process_workers = [
-            asyncio.create_task(self._process_worker.process(), name=f"worker_{i}")
-            for i in range(self.config.queue.get("process_worker_count", 1))
-        ]
+    def reload(self) -> None:
+        # Semaphore sizes are fixed at start; only the cached limits refresh.
+        self.process_worker.reload()
+        self.preprocess_worker.reload()
+
+    async def _run_pipeline(self, packet: CommandPacket) -> None:
+        preprocessed_packet = await self.preprocess_worker.preprocess(packet)
+        if preprocessed_packet:
+            await self.process_worker.process(preprocessed_packet)
 
     def spawn_preprocess_worker(self, packet: CommandPacket) -> None:
-        asyncio.create_task(self.preprocess_worker.preprocess(packet))
+        task = asyncio.create_task(self._run_pipeline(packet))
+        self.pipeline_tasks.add(task)
+        task.add_done_callback(self.pipeline_tasks.discard)
 
     async def stop(self) -> None:
-        for task in self.process_workers:
+        for task in self.pipeline_tasks:
             task.cancel()
 
-        await asyncio.gather(*self.process_workers, return_exceptions=True)
-
-        async with self.preprocess_lock:
-            self.preprocess_tasks.clear()
+        await asyncio.gather(*self.pipeline_tasks, return_exceptions=True)
+        await self.command_handler.stop()
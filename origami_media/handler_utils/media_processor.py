@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+import asyncio
 import re
 import unicodedata
 import uuid
 from io import BytesIO
 from typing import TYPE_CHECKING, Dict, Literal, Optional, Tuple, Union
-from urllib.parse import urlparse
 
 from mautrix.util.magic import mimetype
 
+from origami_media.handler_utils.url_utils import (
+    extract_domain,
+    extract_host,
+    match_domain,
+)
 from origami_media.models.media_models import Media, MediaFile, MediaInfo, MediaRequest
 from origami_media.services.ffmpeg import Ffmpeg
 from origami_media.services.native import Native
@@ -21,6 +26,11 @@ if TYPE_CHECKING:
     from origami_media.main import Config
     from origami_media.services.ffmpeg import FfmpegMetadata
 
+_INVALID_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1F\'’“”]')
+_WHITESPACE_RUN = re.compile(r"\s+")
+_REPEATED_UNDERSCORES = re.compile(r"__+")
+_UNDERSCORE_RUN = re.compile(r"_+")
+
 
 class MediaProcessor:
     def __init__(self, config: "Config", log: "TraceLogger", http: "ClientSession"):
@@ -33,21 +43,40 @@ class MediaProcessor:
         self.native_controller = Native(
             log=self.log, config=self.config, http=self.http
         )
+        self.reload()
+
+    def reload(self) -> None:
+        # Limits and feature flags read per download, snapshotted per config load.
+        self.max_duration = self.config.file.get("max_duration", 0)
+        self.max_audio_only_duration = self.config.file.get(
+            "max_audio_only_duration", 0
+        )
+        self.max_in_memory_file_size = self.config.file.get("max_in_memory_file_size")
+        self.thumbnail_fallback = self.config.ytdlp.get(
+            "enable_thumbnail_fallback_if_duration_or_size_exceeds"
+        )
+        self.video_postprocessing = self.config.ffmpeg.get(
+            "enable_video_postprocessing"
+        )
+        self.audio_postprocessing = self.config.ffmpeg.get(
+            "enable_audio_postprocessing"
+        )
+        self.livestream_previews = self.config.ffmpeg.get("enable_livestream_previews")
+        self.thumbnail_generation = self.config.ffmpeg.get(
+            "enable_thumbnail_generation"
+        )
+
+    async def stop(self) -> None:
+        await self.ytdlp_controller.stop()
 
     def _get_domain(self, url) -> str:
-        domain = urlparse(url).netloc.split(":")[0].split(".")[-2:]
-        domain = ".".join(domain).lower()
-        return domain
+        return match_domain(url, self.config.platform_domains) or extract_domain(url)
 
     async def _get_platform_config(self, domain, query_derived=False) -> Optional[dict]:
         if query_derived:
             config_key = "query"
         else:
-            config_key = None
-            for platform in self.config.platforms:
-                if platform["domain"] == domain:
-                    config_key = platform["config_key"]
-                    break
+            config_key = self.config.platform_keys.get(domain)
             if not config_key:
                 self.log.warning(f"No config key set for {domain}")
                 return None
@@ -68,17 +97,17 @@ class MediaProcessor:
 
         try:
             # Check if the file exists
-            if self.native_controller.file_exists(
+            if await self.native_controller.file_exists(
                 directory="/tmp", file_name=f"{platform_config['name']}-cookies.txt"
             ):
-                previous_cookie_str = self.native_controller.read_from_file(
+                previous_cookie_str = await self.native_controller.read_from_file(
                     directory="/tmp", file_name=f"{platform_config['name']}-cookies.txt"
                 )
 
                 # Update the file only if content differs
                 if previous_cookie_str != current_cookie_str:
                     self.log.info("Updating cookies.txt as the content has changed.")
-                    updated = self.native_controller.write_to_directory(
+                    updated = await self.native_controller.write_to_directory(
                         directory="/tmp",
                         file_name=f"{platform_config['name']}-cookies.txt",
                         content=current_cookie_str,
@@ -91,7 +120,7 @@ class MediaProcessor:
             else:
                 # Write new cookies file if it doesn't exist
                 self.log.info("cookies.txt not found. Writing new file.")
-                created = self.native_controller.write_to_directory(
+                created = await self.native_controller.write_to_directory(
                     directory="/tmp",
                     file_name=f"{platform_config['name']}-cookies.txt",
                     content=current_cookie_str,
@@ -193,12 +222,20 @@ class MediaProcessor:
         self,
         ytdlp_metadata: dict,
         platform_config: dict,
+        thumbnail_prefetch: Optional[asyncio.Task] = None,
     ) -> Optional[bytes]:
         self.log.info("Attempting to fallback to thumbnail.")
         if not ytdlp_metadata.get("thumbnail"):
             self.log.warning("No thumbnail found.")
             return None
 
+        # The same thumbnail is usually being prefetched already; it is only
+        # downloaded again if that fetch failed.
+        if thumbnail_prefetch is not None:
+            result = await thumbnail_prefetch
+            if result:
+                return result[0]
+
         data = await self._download_simple_media(
             ytdlp_metadata["thumbnail"],
             platform_config=platform_config,
@@ -221,10 +258,10 @@ class MediaProcessor:
                     or type_ == "application"
                     and modifier != "force_audio_only"
                 ):
-                    if self.config.ffmpeg.get("enable_video_postprocessing"):
+                    if self.video_postprocessing:
                         data = await self.ffmpeg_controller.postprocess_video(data)
                 elif type_ == "audio" and not platform_config["ytdlp"]:
-                    if self.config.ffmpeg.get("enable_audio_postprocessing"):
+                    if self.audio_postprocessing:
                         data = await self.ffmpeg_controller.prostprocess_audio(data)
 
             processed_data = data
@@ -256,10 +293,11 @@ class MediaProcessor:
         platform_config: dict,
         uuid: str,
         modifier=None,
+        thumbnail_prefetch: Optional[asyncio.Task] = None,
     ) -> Tuple[Optional[bytes], bool]:
         try:
             if ytdlp_metadata.get("is_live"):
-                if not self.config.ffmpeg.get("enable_livestream_previews"):
+                if not self.livestream_previews:
                     self.log.warning(
                         "Live media detected, but livestream previews are disabled."
                     )
@@ -273,34 +311,32 @@ class MediaProcessor:
             # Check duration constraints
             duration = ytdlp_metadata.get("duration")
             if modifier is not None and modifier == "force_audio_only":
-                max_duration = self.config.file.get("max_audio_only_duration", 0)
+                max_duration = self.max_audio_only_duration
             else:
-                max_duration = self.config.file.get("max_duration", 0)
+                max_duration = self.max_duration
             if duration and duration > max_duration:
                 self.log.warning("Media length exceeds the configured duration limit.")
-                if not self.config.ytdlp.get(
-                    "enable_thumbnail_fallback_if_duration_or_size_exceeds"
-                ):
+                if not self.thumbnail_fallback:
                     return None, False
                 data = await self._attempt_thumbnail_fallback(
                     ytdlp_metadata,
                     platform_config=platform_config,
+                    thumbnail_prefetch=thumbnail_prefetch,
                 )
                 is_thumbnail_fallback = True
                 return data, is_thumbnail_fallback
 
             # Check size contraints
             size = ytdlp_metadata.get("filesize_approx")
-            max_size = self.config.file.get("max_in_memory_file_size")
+            max_size = self.max_in_memory_file_size
             if size and size > max_size:
                 self.log.warning("Media size exceeds the configured size limit.")
-                if not self.config.ytdlp.get(
-                    "enable_thumbnail_fallback_if_duration_or_size_exceeds"
-                ):
+                if not self.thumbnail_fallback:
                     return None, False
                 data = await self._attempt_thumbnail_fallback(
                     ytdlp_metadata,
                     platform_config=platform_config,
+                    thumbnail_prefetch=thumbnail_prefetch,
                 )
                 is_thumbnail_fallback = True
                 return data, is_thumbnail_fallback
@@ -330,13 +366,12 @@ class MediaProcessor:
 
             except DownloadSizeExceededError:
                 self.log.warning("Media size exceeds the configured file size limit.")
-                if not self.config.ytdlp.get(
-                    "enable_thumbnail_fallback_if_duration_or_size_exceeds"
-                ):
+                if not self.thumbnail_fallback:
                     return None, False
                 data = await self._attempt_thumbnail_fallback(
                     ytdlp_metadata,
                     platform_config=platform_config,
+                    thumbnail_prefetch=thumbnail_prefetch,
                 )
                 is_thumbnail_fallback = True
                 return data, is_thumbnail_fallback
@@ -360,15 +395,15 @@ class MediaProcessor:
             .decode("ASCII")
         )
         # Replace invalid characters
-        filename = re.sub(r'[<>:"/\\|?*\x00-\x1F\'’“”]', "_", filename)
+        filename = _INVALID_FILENAME_CHARS.sub("_", filename)
         # Replace spaces with underscores
-        filename = re.sub(r"\s+", "_", filename)
+        filename = _WHITESPACE_RUN.sub("_", filename)
         # Replace multiple underscores with a single one
-        filename = re.sub(r"__+", "_", filename)
+        filename = _REPEATED_UNDERSCORES.sub("_", filename)
         # Trim leading and trailing dots/underscores and enforce max length
         filename = filename.strip("_.")[:255]
         # Final cleanup of redundant underscores
-        filename = re.sub(r"_+", "_", filename)
+        filename = _UNDERSCORE_RUN.sub("_", filename)
 
         return filename
 
@@ -429,7 +464,7 @@ class MediaProcessor:
 
         metadata = {
             "id": str(url_uuid),
-            "extractor": urlparse(url).netloc.split(":")[0],
+            "extractor": extract_host(url),
             "uploader": "unknown_uploader",
             "title": "unknown_title",
             "url": url,
@@ -475,7 +510,7 @@ class MediaProcessor:
 
         metadata = {
             "id": str(url_uuid),
-            "extractor": urlparse(url).netloc.split(":")[0],
+            "extractor": extract_host(url),
             "uploader": "unknown_uploader",
             "title": "unknown_title",
             "url": url,
@@ -491,6 +526,7 @@ class MediaProcessor:
         ytdlp_metadata: Optional[dict],
         uuid: str,
         modifier=None,
+        thumbnail_prefetch: Optional[asyncio.Task] = None,
     ) -> Optional[MediaFile]:
         if not platform_config.get("ytdlp"):
             data = await self._download_simple_media(
@@ -516,6 +552,7 @@ class MediaProcessor:
                     platform_config=platform_config,
                     modifier=modifier,
                     uuid=uuid,
+                    thumbnail_prefetch=thumbnail_prefetch,
                 )
                 if data:
                     result = await self._post_process(
@@ -539,31 +576,33 @@ class MediaProcessor:
         primary_media_object: MediaFile,
         platform_config: dict,
         modifier=None,
+        thumbnail_prefetch: Optional[asyncio.Task] = None,
     ) -> Optional[MediaFile]:
         if (
             primary_media_object.metadata.origin == "advanced"
             and primary_media_object.metadata.thumbnail_url
         ):
-            data = await self._download_simple_media(
-                primary_media_object.metadata.thumbnail_url,
-                platform_config=platform_config,
-            )
-            if data:
-                result = await self._post_process(data, platform_config=None)
-                if result:
-                    _, metadata = result
-                    return await self._process_thumbnail_media(
-                        data,
-                        ffmpeg_metadata=metadata,
-                        url=primary_media_object.metadata.url,
-                    )
+            if thumbnail_prefetch:
+                result = await thumbnail_prefetch
+            else:
+                result = await self._fetch_thumbnail(
+                    primary_media_object.metadata.thumbnail_url,
+                    platform_config=platform_config,
+                )
+            if result:
+                data, metadata = result
+                return await self._process_thumbnail_media(
+                    data,
+                    ffmpeg_metadata=metadata,
+                    url=primary_media_object.metadata.url,
+                )
 
         if modifier is not None and modifier == "force_audio_only":
             return
 
         elif (
             primary_media_object.metadata.media_type == "video"
-            and self.config.ffmpeg["enable_thumbnail_generation"]
+            and self.thumbnail_generation
         ):
             primary_media_object.stream.seek(0)
             data = await self.ffmpeg_controller.extract_thumbnail(
@@ -582,25 +621,56 @@ class MediaProcessor:
 
         return None
 
-    async def process_request(self, request: MediaRequest) -> Optional[Media]:
+    async def _fetch_thumbnail(
+        self, url: str, platform_config: dict
+    ) -> Optional[Tuple[bytes, FfmpegMetadata]]:
+        data = await self._download_simple_media(url, platform_config=platform_config)
+        if not data:
+            return None
+        return await self._post_process(data, platform_config=None)
 
-        primary_file_object = await self._primary_media_controller(
-            request.url,
-            platform_config=request.platform_config,
-            modifier=request.modifier,
-            ytdlp_metadata=request.ytdlp_metadata,
-            uuid=request.uuid,
-        )
+    def _prefetch_thumbnail(self, request: MediaRequest) -> Optional[asyncio.Task]:
+        # The query already names the thumbnail, so it is downloaded and probed
+        # while the primary media is; a thumbnail fallback reuses it as well.
+        if not request.platform_config.get("ytdlp") or not request.ytdlp_metadata:
+            return None
 
-        if not primary_file_object:
-            self.log.warning("Failed to process primary media.")
+        thumbnail_url = request.ytdlp_metadata.get("thumbnail")
+        if not thumbnail_url:
             return None
 
-        thumbnail_file_object = await self._thumbnail_media_controller(
-            primary_file_object,
-            modifier=request.modifier,
-            platform_config=request.platform_config,
+        return asyncio.create_task(
+            self._fetch_thumbnail(
+                thumbnail_url, platform_config=request.platform_config
+            )
         )
+
+    async def process_request(self, request: MediaRequest) -> Optional[Media]:
+        thumbnail_prefetch = self._prefetch_thumbnail(request)
+        try:
+            primary_file_object = await self._primary_media_controller(
+                request.url,
+                platform_config=request.platform_config,
+                modifier=request.modifier,
+                ytdlp_metadata=request.ytdlp_metadata,
+                uuid=request.uuid,
+                thumbnail_prefetch=thumbnail_prefetch,
+            )
+
+            if not primary_file_object:
+                self.log.warning("Failed to process primary media.")
+                return None
+
+            thumbnail_file_object = await self._thumbnail_media_controller(
+                primary_file_object,
+                modifier=request.modifier,
+                platform_config=request.platform_config,
+                thumbnail_prefetch=thumbnail_prefetch,
+            )
+        finally:
+            if thumbnail_prefetch and not thumbnail_prefetch.done():
+                thumbnail_prefetch.cancel()
+
         if not thumbnail_file_object:
             self.log.warning("Thumbnail was not obtained.")
 
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from typing import AbstractSet, Optional
+
+
+def extract_host(url: str) -> str:
+    # A str.find based stand-in for urlparse(url).netloc without the port,
+    # for the absolute http(s) URLs produced by UrlHandler.
+    start = url.find("://")
+    if start == -1:
+        return ""
+    start += 3
+
+    end = len(url)
+    for delimiter in "/?#":
+        index = url.find(delimiter, start, end)
+        if index != -1:
+            end = index
+
+    at = url.rfind("@", start, end)
+    if at != -1:
+        start = at + 1
+
+    colon = url.find(":", start, end)
+    if colon != -1:
+        end = colon
+
+    return url[start:end]
+
+
+def extract_domain(url: str) -> str:
+    host = extract_host(url)
+    return host[host.rfind(".", 0, host.rfind(".")) + 1 :].lower()
+
+
+def match_domain(url: str, domains: AbstractSet[str]) -> Optional[str]:
+    # The configured domain the host equals or is a subdomain of, found by
+    # probing each dot suffix, so "www.bbc.co.uk" matches "bbc.co.uk" and
+    # "youtube.com.example.net" matches nothing.
+    host = extract_host(url).lower()
+    while host:
+        if host in domains:
+            return host
+        dot = host.find(".")
+        if dot == -1:
+            return None
+        host = host[dot + 1 :]
+    return None
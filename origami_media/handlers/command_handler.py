@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+import asyncio
 from functools import wraps
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Any, Coroutine, Optional, Set
 
 from origami_media.models.command_models import (
     ALIASES,
@@ -22,6 +23,10 @@ if TYPE_CHECKING:
     from origami_media.main import Config
 
 
+_HOURGLASS = "⏳"
+_LOADING = "🔄"
+
+
 # Command methods are defined here.
 
 
@@ -45,23 +50,44 @@ class CommandHandler:
         self.media_handler = media_handler
         self.query_handler = query_handler
         self.url_handler = url_handler
+        self.background_tasks: Set[asyncio.Task] = set()
+
+    def _run_in_background(self, coro: Coroutine[Any, Any, Any]) -> None:
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self._finish_background_task)
+
+    def _finish_background_task(self, task: asyncio.Task) -> None:
+        self.background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            self.log.warning(f"Background task failed: {task.exception()}")
+
+    def _redact_in_background(self, packet: CommandPacket) -> None:
+        # Status reactions are cleared out of band so replies are not held up
+        # by the redaction round-trip.
+        if packet.reaction_id:
+            self._run_in_background(
+                self.client.redact(
+                    room_id=packet.event.room_id, event_id=packet.reaction_id
+                )
+            )
+            packet.reaction_id = None
+
+    async def stop(self) -> None:
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
 
     @staticmethod
     def ensure_reaction_cleanup(method):
         @wraps(method)
         async def wrapper(self, packet: CommandPacket, *args, **kwargs):
             try:
-                if packet.reaction_id:
-                    await self.client.redact(
-                        room_id=packet.event.room_id, event_id=packet.reaction_id
-                    )
+                # The hourglass is bookkeeping; the command starts while its
+                # redaction is still in flight. Clearing reaction_id here keeps
+                # the cleanup below from redacting it a second time.
+                self._redact_in_background(packet)
                 return await method(self, packet, *args, **kwargs)
             finally:
-                if packet.reaction_id:
-                    await self.client.redact(
-                        room_id=packet.event.room_id, event_id=packet.reaction_id
-                    )
-                    packet.reaction_id = None
+                self._redact_in_background(packet)
 
         return wrapper
 
@@ -88,6 +114,14 @@ class CommandHandler:
 
         return preprocessed_packet
 
+    async def acknowledge(self, packet: CommandPacket) -> None:
+        # Called only once the packet has been admitted for processing, so no
+        # reaction is sent for packets that end up being dropped.
+        try:
+            packet.reaction_id = await packet.event.react(_HOURGLASS)
+        except Exception as e:
+            self.log.warning(f"Failed to react to {packet.event.event_id}: {e}")
+
     async def _preprocess_url(self, packet: CommandPacket) -> Optional[CommandPacket]:
         result = self.url_handler.process(packet.event)
         if not result:
@@ -105,11 +139,9 @@ class CommandHandler:
             return None
 
         packet.data["valid_urls"] = valid_urls
-        packet.reaction_id = await packet.event.react("⏳")
         return packet
 
     async def _preprocess_query(self, packet: CommandPacket) -> CommandPacket:
-        packet.reaction_id = await packet.event.react("⏳")
         return packet
 
     async def _preprocess_print(self, packet: CommandPacket) -> None:
@@ -160,7 +192,7 @@ class CommandHandler:
             return
 
     async def _process_url(self, packet: CommandPacket) -> None:
-        packet.reaction_id = await packet.event.react("🔄")
+        packet.reaction_id = await packet.event.react(_LOADING)
 
         valid_urls = packet.data["valid_urls"]
 
@@ -172,18 +204,14 @@ class CommandHandler:
 
         processed_media = await self.media_handler.process(requests=media_requests)
 
-        if packet.reaction_id:
-            await self.client.redact(
-                room_id=packet.event.room_id, event_id=packet.reaction_id
-            )
-            packet.reaction_id = None
+        self._redact_in_background(packet)
 
         await self.display_handler.render_media(
             media=processed_media, event=packet.event, additional_data=packet.data
         )
 
     async def _process_query(self, packet: CommandPacket) -> None:
-        packet.reaction_id = await packet.event.react("🔄")
+        packet.reaction_id = await packet.event.react(_LOADING)
 
         api_provider = packet.command.modifier or ""
         url = await self.query_handler.query_image_controller(
@@ -197,11 +225,7 @@ class CommandHandler:
 
         processed_media = await self.media_handler.process(requests=media_requests)
 
-        if packet.reaction_id:
-            await self.client.redact(
-                room_id=packet.event.room_id, event_id=packet.reaction_id
-            )
-            packet.reaction_id = None
+        self._redact_in_background(packet)
 
         await self.display_handler.render_media(
             media=processed_media,
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+import asyncio
 import os
-import subprocess
+import shutil
 import sys
 from types import ModuleType
 from typing import Optional
@@ -19,6 +20,27 @@ class DependencyHandler:
         message = f"""**Error Details:** {error} **{title}**"""
         await event.respond(message)
 
+    async def _run_cli(self, name: str, *args: str) -> tuple[str, str]:
+        # Resolves the binary in-process instead of forking `which`, and awaits
+        # the child so a slow tool does not block the event loop.
+        location = shutil.which(name)
+        if not location:
+            raise FileNotFoundError(f"{name} not found on PATH")
+
+        process = await asyncio.create_subprocess_exec(
+            location,
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"{name} exited with {process.returncode}: "
+                f"{stderr.decode(errors='replace').strip()}"
+            )
+        return stdout.decode(errors="replace"), location
+
     async def _format_check_result(self, title: str, result: dict) -> str:
         if result["status"]:
             details = (
@@ -91,14 +113,8 @@ class DependencyHandler:
 
     async def check_yt_cli(self, event=None) -> dict:
         try:
-            result = subprocess.run(
-                ["yt-dlp", "--version"], capture_output=True, text=True, check=True
-            )
-            version = result.stdout.strip() if result.stdout else "Unknown"
-
-            yt_dlp_location = subprocess.run(
-                ["which", "yt-dlp"], capture_output=True, text=True, check=True
-            ).stdout.strip()
+            output, yt_dlp_location = await self._run_cli("yt-dlp", "--version")
+            version = output.strip() or "Unknown"
 
             self.log.info(
                 f"DependencyHandler.check_yt_cli: Version={version}, Location={yt_dlp_location}"
@@ -155,18 +171,12 @@ class DependencyHandler:
 
     async def check_ffmpeg_cli(self, event=None) -> dict:
         try:
-            result = subprocess.run(
-                ["ffmpeg", "-version"], capture_output=True, text=True, check=True
-            )
-            version_line = result.stdout.splitlines()[0]
+            output, ffmpeg_location = await self._run_cli("ffmpeg", "-version")
+            version_line = output.splitlines()[0]
             version = (
                 version_line.split(" ")[2] if "version" in version_line else "Unknown"
             )
 
-            ffmpeg_location = subprocess.run(
-                ["which", "ffmpeg"], capture_output=True, text=True, check=True
-            ).stdout.strip()
-
             self.log.info(
                 f"DependencyHandler.check_ffmpeg_cli: Version={version}, Location={ffmpeg_location}"
             )
@@ -1,14 +1,16 @@
 from __future__ import annotations
 
+import asyncio
 from io import BytesIO
 from typing import TYPE_CHECKING, Optional, Tuple
 
+from aiohttp import ClientSession, TCPConnector
+
 from origami_media.handler_utils.media_processor import MediaProcessor
 from origami_media.handler_utils.media_uploader import SynapseProcessor
 from origami_media.models.media_models import ProcessedMedia
 
 if TYPE_CHECKING:
-    from aiohttp import ClientSession
     from maubot.matrix import MaubotMatrixClient
     from mautrix.util.logging.trace import TraceLogger
 
@@ -28,13 +30,32 @@ class MediaHandler:
         self.client = client
         self.config = config
         self.http = http
+        # Downloads get their own pool so CDN connections and DNS answers are
+        # kept between requests longer than the shared plugin session allows.
+        self.download_session = ClientSession(
+            connector=TCPConnector(
+                limit=self.config.http.get("connection_limit", 32),
+                ttl_dns_cache=self.config.http.get("dns_cache_ttl", 300),
+                keepalive_timeout=self.config.http.get("keepalive_timeout", 60),
+            ),
+            read_bufsize=self.config.http.get("read_buffer_size", 262144),
+        )
         self.media_processor = MediaProcessor(
-            log=self.log, config=self.config, http=self.http
+            log=self.log, config=self.config, http=self.download_session
         )
         self.synapse_processor = SynapseProcessor(
             log=self.log, client=self.client, config=self.config
         )
 
+    def reload(self) -> None:
+        self.media_processor.reload()
+
+    async def close(self) -> None:
+        # Shared yt-dlp runs outlive any single pipeline task, so they are
+        # cancelled here together with the download session.
+        await self.media_processor.stop()
+        await self.download_session.close()
+
     async def _upload_media(self, media_object: "Media") -> Tuple[str, Optional[str]]:
         content_upload_result: Optional[str] = None
         thumbnail_upload_result: Optional[str] = None
@@ -43,31 +64,38 @@ class MediaHandler:
             if not media_object.content:
                 raise ValueError("Content is required for upload but is missing.")
 
-            content_part = media_object.content
-            content_part.stream.seek(0)
-            content_upload_result = (
-                await self.synapse_processor.upload_to_content_repository(
-                    data=content_part.stream,
-                    filename=content_part.filename,
-                    size=content_part.metadata.size or 0,
-                )
-            )
+            # Content and thumbnail are uploaded concurrently; a failed
+            # thumbnail upload only drops the thumbnail.
+            uploads = []
+            for media_part in [media_object.content, media_object.thumbnail]:
+                if media_part:
+                    media_part.stream.seek(0)
+                    uploads.append(
+                        self.synapse_processor.upload_to_content_repository(
+                            data=media_part.stream,
+                            filename=media_part.filename,
+                            size=media_part.metadata.size or 0,
+                        )
+                    )
 
+            results = await asyncio.gather(*uploads, return_exceptions=True)
+
+            content_part = media_object.content
+            content_upload_result = results[0]
+            if isinstance(content_upload_result, BaseException):
+                raise content_upload_result
             if not content_upload_result:
                 raise RuntimeError(
                     f"Failed to upload content file: {content_part.filename}"
                 )
 
-            if media_object.thumbnail:
-                thumbnail_part = media_object.thumbnail
-                thumbnail_part.stream.seek(0)
-                thumbnail_upload_result = (
-                    await self.synapse_processor.upload_to_content_repository(
-                        data=thumbnail_part.stream,
-                        filename=thumbnail_part.filename,
-                        size=thumbnail_part.metadata.size or 0,
+            if len(results) > 1:
+                thumbnail_upload_result = results[1]
+                if isinstance(thumbnail_upload_result, BaseException):
+                    self.log.warning(
+                        f"Failed to upload thumbnail file: {thumbnail_upload_result}"
                     )
-                )
+                    thumbnail_upload_result = None
 
             return content_upload_result, thumbnail_upload_result
 
@@ -76,65 +104,74 @@ class MediaHandler:
                 if media_part and isinstance(media_part.stream, BytesIO):
                     media_part.stream.close()
 
+    async def _preprocess_url(
+        self, url: str, modifier=None, query_derived=False
+    ) -> Optional[MediaRequest]:
+        try:
+            request = await self.media_processor.create_media_request(
+                url=url, modifier=modifier, query_derived=query_derived
+            )
+            if not request:
+                self.log.error(f"Failed to access platform config: {url}")
+            return request
+
+        except Exception as e:
+            self.log.error(
+                f"MediaHandler.preprocess: Unexpected error for URL {url}: {e}"
+            )
+            return None
+
     async def preprocess(
         self, urls: list[str], modifier=None, query_derived=False
     ) -> list[MediaRequest]:
-        media_request_array: list[MediaRequest] = []
-        for url in urls:
-            try:
-                request = await self.media_processor.create_media_request(
-                    url=url, modifier=modifier, query_derived=query_derived
+        # URLs in one message are independent, so they are queried together;
+        # their count is already capped by the message URL limit.
+        results = await asyncio.gather(
+            *(
+                self._preprocess_url(
+                    url, modifier=modifier, query_derived=query_derived
                 )
-                if not request:
-                    self.log.error(f"Failed to access platform config: {url}")
-                    continue
-
-                media_request: MediaRequest = request
-                media_request_array.append(media_request)
+                for url in urls
+            )
+        )
+        return [request for request in results if request]
 
-            except Exception as e:
-                self.log.error(
-                    f"MediaHandler.preprocess: Unexpected error for URL {url}: {e}"
+    async def _process_request(
+        self, request: MediaRequest
+    ) -> Optional[ProcessedMedia]:
+        try:
+            media_object: Optional["Media"] = (
+                await self.media_processor.process_request(request)
+            )
+            if not media_object:
+                self.log.warning(
+                    f"MediaHandler.process: Failed to process URL: {request.url}"
                 )
-                continue
+                return None
+
+            media_uri, thumbnail_uri = await self._upload_media(media_object)
+
+            return ProcessedMedia(
+                filename=media_object.content.filename,
+                content_info=media_object.content.metadata,
+                content_uri=media_uri,
+                thumbnail_info=(
+                    media_object.thumbnail.metadata if media_object.thumbnail else None
+                ),
+                thumbnail_uri=thumbnail_uri,
+            )
 
-        return media_request_array
+        except Exception as e:
+            self.log.error(
+                f"MediaHandler.process: Unexpected error for URL {request.url}: {e}"
+            )
+            return None
 
     async def process(self, requests: list[MediaRequest]) -> list[ProcessedMedia]:
-        processed_media_array: list[ProcessedMedia] = []
-
-        for request in requests:
-            try:
-                media_object: Optional["Media"] = (
-                    await self.media_processor.process_request(request)
-                )
-                if not media_object:
-                    self.log.warning(
-                        f"MediaHandler.process: Failed to process URL: {request.url}"
-                    )
-                    continue
-
-                media_uri, thumbnail_uri = await self._upload_media(media_object)
-
-                processed_media_array.append(
-                    ProcessedMedia(
-                        filename=media_object.content.filename,
-                        content_info=media_object.content.metadata,
-                        content_uri=media_uri,
-                        thumbnail_info=(
-                            media_object.thumbnail.metadata
-                            if media_object.thumbnail
-                            else None
-                        ),
-                        thumbnail_uri=thumbnail_uri,
-                    )
-                )
-
-            except Exception as e:
-                self.log.error(
-                    f"MediaHandler.process: Unexpected error for URL {request.url}: {e}"
-                )
-                continue
+        results = await asyncio.gather(
+            *(self._process_request(request) for request in requests)
+        )
+        processed_media_array = [media for media in results if media]
 
         if not processed_media_array:
             raise Exception(
@@ -1,9 +1,17 @@
 from __future__ import annotations
 
+import json
 import random
 import urllib.parse
 from typing import TYPE_CHECKING, Optional
 
+try:
+    import orjson  # type: ignore
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 if TYPE_CHECKING:
     from aiohttp import ClientSession
     from mautrix.util.logging.trace import TraceLogger
@@ -40,7 +48,7 @@ class QueryHandler:
                 if response.status != 200:
                     self.log.error(f"Failed request to {url}: {await response.text()}")
                     return None
-                return await response.json()
+                return _json_loads(await response.read())
 
         if provider == "tenor":
             rating = "off"
@@ -2,7 +2,13 @@ from __future__ import annotations
 
 import re
 from typing import TYPE_CHECKING, Optional
-from urllib.parse import urlparse
+
+from origami_media.handler_utils.url_utils import extract_domain, match_domain
+
+try:
+    import re2 as _scan_re  # type: ignore
+except ImportError:
+    _scan_re = re
 
 if TYPE_CHECKING:
     from maubot.matrix import MaubotMessageEvent
@@ -15,51 +21,96 @@ class UrlHandler:
     def __init__(self, config: "Config", log: "TraceLogger"):
         self.config = config
         self.log = log
-
-    DETECT_YOUTUBE_TRACKERS_SI = re.compile(
-        r"https?://(?:www\.|m\.)?(?:youtube\.com/(?:watch\?v=|shorts/|live/)|youtu\.be/)([a-zA-Z0-9_-]+).*?\?si=([a-zA-Z0-9_-]+)",
-        re.IGNORECASE,
+        self.reload()
+
+    def reload(self) -> None:
+        # Settings read on every message, snapshotted per config load.
+        self.use_whitelist = self.config.meta.get(
+            "use_platform_domains_as_whitelist", True
+        )
+        self.censor_trackers = self.config.meta.get("censor_trackers", True)
+        self.max_message_url_count = self.config.queue.get("max_message_url_count", 1)
+        self.max_query_url_count = self.config.queue.get("max_message_url_count", 3)
+
+    # Scanned over every message body or URL, so they use the linear-time re2
+    # engine when it is installed; flags are inline and there are no lookarounds
+    # to keep both engines compatible.
+    EXTRACT_YOUTUBE_VIDEO_ID = _scan_re.compile(
+        r"(?i)https?://(?:www\.|m\.)?(?:youtube\.com/(?:watch\?(?:\S*?&)?v=|shorts/|live/)|youtu\.be/)([a-zA-Z0-9_-]+)"
     )
 
-    EXTRACT_YOUTUBE_VIDEO_ID = re.compile(
-        r"https?://(?:www\.|m\.)?(?:youtube\.com/(?:watch\?v=|shorts/|live/)|youtu\.be/)([a-zA-Z0-9_-]+)",
-        re.IGNORECASE,
-    )
+    REMOVE_BACKTICKS_REGEX = _scan_re.compile(r"(?is)`.*?`|```.*?```")
 
-    TIMESTAMP_REGEX = re.compile(r"[?&]t=(\d+)")
-
-    REMOVE_BACKTICKS_REGEX = re.compile(r"`.*?`|```.*?```", re.DOTALL | re.IGNORECASE)
+    URL_REGEX = _scan_re.compile(
+        r"\bhttps?:\/\/(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}(?:\/\S*)?\b"
+    )
 
-    URL_REGEX = re.compile(r"\bhttps?:\/\/(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}(?:\/\S*)?\b")
+    def _find_urls(self, message: str) -> list[str]:
+        # Scan the gaps between code spans in place instead of building a copy
+        # of the message with the spans removed.
+        urls = []
+        last = 0
+        for code_span in self.REMOVE_BACKTICKS_REGEX.finditer(message):
+            urls += self.URL_REGEX.findall(message, last, code_span.start())
+            last = code_span.end()
+        urls += self.URL_REGEX.findall(message, last)
+        return urls
 
     def _extract_urls(self, message):
-        clean_message = self.REMOVE_BACKTICKS_REGEX.sub("", message)
-        urls = re.findall(self.URL_REGEX, clean_message)
-        self.log.info(f"Filtered: {urls}")
+        urls = self._find_urls(message)
+        self.log.info("Filtered: %s", urls)
         return list(dict.fromkeys(urls))
 
-    def _validate_domain(self, url: str, check_whitelist: bool) -> str | None:
-        domain = urlparse(url).netloc.split(":")[0].split(".")[-2:]
-        domain = ".".join(domain).lower()
+    def quick_has_valid(self, message: str) -> bool:
+        # Cheap gate for passive detection: one scan plus a set probe, so
+        # messages that process() would reject never spawn a pipeline task.
+        urls = self._find_urls(message)
+        if not self.use_whitelist:
+            return bool(urls)
 
-        if check_whitelist:
-            whitelist = {platform["domain"] for platform in self.config.platforms}
-            if domain not in whitelist:
-                self.log.warning(f"Invalid or unwhitelisted domain: {domain}")
+        platform_domains = self.config.platform_domains
+        return any(match_domain(url, platform_domains) for url in urls)
+
+    def _validate_domain(self, url: str, check_whitelist: bool) -> str | None:
+        domain = match_domain(url, self.config.platform_domains)
+        if domain is None:
+            domain = extract_domain(url)
+            if check_whitelist:
+                self.log.warning("Invalid or unwhitelisted domain: %s", domain)
                 return None
 
         return domain
 
-    def _process_youtube_url(self, url: str) -> str | None:
+    @staticmethod
+    def _find_timestamp(url: str, start: int) -> str:
+        # Equivalent to searching for r"[?&]t=(\d+)" from the start of the
+        # query, so "t" is found before or after "v", without the regex engine.
+        start = url.find("t=", start)
+        while start != -1:
+            if url[start - 1] in "?&":
+                end = start + 2
+                while end < len(url) and url[end].isdigit():
+                    end += 1
+                if end > start + 2:
+                    return url[start + 2 : end]
+            start = url.find("t=", start + 1)
+        return ""
+
+    def _process_youtube_url(self, url: str) -> tuple[str | None, bool]:
         video_match = self.EXTRACT_YOUTUBE_VIDEO_ID.search(url)
         if not video_match:
-            self.log.warning(f"Invalid YouTube URL: {url}.")
-            return None
+            self.log.warning("Invalid YouTube URL: %s.", url)
+            return None, False
 
         video_id = video_match.group(1)
-        timestamp_match = self.TIMESTAMP_REGEX.search(url)
-        timestamp = f"&t={timestamp_match.group(1)}" if timestamp_match else ""
-        return f"https://www.youtube.com/watch?v={video_id}{timestamp}"
+        tracked = url.find("?si=", video_match.end()) != -1
+        query = url.find("?", video_match.start())
+        seconds = self._find_timestamp(url, query + 1) if query != -1 else ""
+        timestamp = f"&t={seconds}" if seconds else ""
+        return (
+            f"https://www.youtube.com/watch?v={video_id}{timestamp}",
+            tracked,
+        )
 
     def process(
         self, event: "MaubotMessageEvent"
@@ -67,13 +118,14 @@ class UrlHandler:
         valid_urls = []
         message = str(event.content.body)
         exceeds_url_limit = False
-        whitelist = False
-        if self.config.meta.get("use_platform_domains_as_whitelist", True):
-            whitelist = True
+        whitelist = self.use_whitelist
 
         urls = self._extract_urls(message)
-        if len(urls) > self.config.queue.get("max_message_url_count", 1):
+        if len(urls) > self.max_message_url_count:
             self.log.warning("urls exceed message limit.")
+            # Over-limit messages are only still examined to censor trackers.
+            if not self.censor_trackers:
+                return None
             exceeds_url_limit = True
 
         if not urls:
@@ -83,6 +135,8 @@ class UrlHandler:
         sanitized_message = message
         url_mapping = {}
         should_censor = False
+        has_trackers = False
+        seen: set[str] = set()
 
         for url in urls:
             try:
@@ -93,42 +147,49 @@ class UrlHandler:
                 processed_url = url
 
                 if domain in ["youtube.com", "youtu.be"]:
-                    processed_url = self._process_youtube_url(url)
+                    processed_url, tracked = self._process_youtube_url(url)
                     if processed_url:
-                        valid_urls.append(processed_url)
+                        if processed_url not in seen:
+                            seen.add(processed_url)
+                            valid_urls.append(processed_url)
                         url_mapping[url] = processed_url
-                else:
+                        has_trackers = has_trackers or tracked
+                elif url not in seen:
+                    seen.add(url)
                     valid_urls.append(url)
 
             except Exception:
-                self.log.error(f"Error processing {url}")
-
-        if self.config.meta.get(
-            "censor_trackers", True
-        ) and self.DETECT_YOUTUBE_TRACKERS_SI.search(message):
-            for original, processed in url_mapping.items():
-                sanitized_message = sanitized_message.replace(original, processed)
-                should_censor = True
+                self.log.error("Error processing %s", url)
+
+        if has_trackers and self.censor_trackers:
+            # One pass over the message; longest originals first so a URL that
+            # prefixes another cannot claim the longer one's match.
+            originals = sorted(url_mapping, key=len, reverse=True)
+            sanitized_message = re.sub(
+                "|".join(map(re.escape, originals)),
+                lambda match: url_mapping[match.group(0)],
+                message,
+            )
+            should_censor = True
 
         if not valid_urls:
             self.log.warning("No valid urls were processed.")
             return None
 
-        unique_valid_urls = list(dict.fromkeys(valid_urls))
-
-        return unique_valid_urls, sanitized_message, should_censor, exceeds_url_limit
+        return valid_urls, sanitized_message, should_censor, exceeds_url_limit
 
     def process_query_url_string(self, message: str) -> list[str]:
         valid_urls = []
         urls = self._extract_urls(message)
 
-        if len(urls) > self.config.queue.get("max_message_url_count", 3):
+        if len(urls) > self.max_query_url_count:
             raise Exception("urls exceed message limit.")
 
         if not urls:
             raise Exception("No urls found in message.")
 
         url_mapping = {}
+        seen: set[str] = set()
 
         for url in urls:
             try:
@@ -139,19 +200,20 @@ class UrlHandler:
                 processed_url = url
 
                 if domain in ["youtube.com", "youtu.be"]:
-                    processed_url = self._process_youtube_url(url)
+                    processed_url, _ = self._process_youtube_url(url)
                     if processed_url:
-                        valid_urls.append(processed_url)
+                        if processed_url not in seen:
+                            seen.add(processed_url)
+                            valid_urls.append(processed_url)
                         url_mapping[url] = processed_url
-                else:
+                elif url not in seen:
+                    seen.add(url)
                     valid_urls.append(url)
 
             except Exception:
-                self.log.error(f"Error processing {url}")
+                self.log.error("Error processing %s", url)
 
         if not valid_urls:
             raise Exception("No valid urls were processed.")
 
-        unique_valid_urls = list(dict.fromkeys(valid_urls))
-
-        return unique_valid_urls
+        return valid_urls
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Dict, Type, cast
+from typing import Any, Dict, FrozenSet, Type, cast
 
 from maubot.handlers import event
 from maubot.matrix import MaubotMessageEvent
@@ -21,47 +21,50 @@ from origami_media.handlers import (
 
 
 class Config(BaseProxyConfig):
+    # Sections are snapshotted as plain attributes after every load so hot
+    # paths avoid a property call and a proxy lookup per access.
+    meta: Dict[str, Any]
+    file: Dict[str, Any]
+    queue: Dict[str, Any]
+    command: Dict[str, Any]
+    ytdlp: Dict[str, Any]
+    http: Dict[str, Any]
+    ffmpeg: Dict[str, Any]
+    platforms: list
+    platform_configs: Dict[str, Any]
+    platform_domains: FrozenSet[str]
+    platform_keys: Dict[str, str]
+
     def do_update(self, helper: ConfigUpdateHelper):
         helper.copy("meta")
         helper.copy("file")
         helper.copy("queue")
         helper.copy("command")
         helper.copy("ytdlp")
+        helper.copy("http")
         helper.copy("ffmpeg")
         helper.copy("platforms")
         helper.copy("platform_configs")
 
-    @property
-    def meta(self) -> Dict[str, Any]:
-        return cast(Dict[str, Any], self.get("meta", {}))
-
-    @property
-    def file(self) -> Dict[str, Any]:
-        return cast(Dict[str, Any], self.get("file", {}))
-
-    @property
-    def queue(self) -> Dict[str, Any]:
-        return cast(Dict[str, Any], self.get("queue", {}))
-
-    @property
-    def command(self) -> Dict[str, Any]:
-        return cast(Dict[str, Any], self.get("command", {}))
-
-    @property
-    def ytdlp(self) -> Dict[str, Any]:
-        return cast(Dict[str, Any], self.get("ytdlp", {}))
-
-    @property
-    def ffmpeg(self) -> Dict[str, Any]:
-        return cast(Dict[str, Any], self.get("ffmpeg", {}))
-
-    @property
-    def platforms(self) -> list:
-        return cast(list, self.get("platforms", []))
-
-    @property
-    def platform_configs(self) -> Dict[str, Any]:
-        return cast(Dict[str, Any], self.get("platform_configs", {}))
+    def load_and_update(self) -> None:
+        super().load_and_update()
+        self.meta = self.get("meta", {}) or {}
+        self.file = self.get("file", {}) or {}
+        self.queue = self.get("queue", {}) or {}
+        self.command = self.get("command", {}) or {}
+        self.ytdlp = self.get("ytdlp", {}) or {}
+        self.http = self.get("http", {}) or {}
+        self.ffmpeg = self.get("ffmpeg", {}) or {}
+        self.platforms = self.get("platforms", []) or []
+        self.platform_configs = self.get("platform_configs", {}) or {}
+
+        # Derived lookups so per-URL checks are a single hash probe.
+        self.platform_keys = {}
+        for platform in self.platforms:
+            self.platform_keys.setdefault(
+                platform["domain"].lower(), platform["config_key"]
+            )
+        self.platform_domains = frozenset(self.platform_keys)
 
 
 class OrigamiMedia(Plugin):
@@ -109,7 +112,12 @@ class OrigamiMedia(Plugin):
             command_handler=self.command_handler,
         )
 
-        await self.worker_manager.spawn_process_workers()
+    async def on_external_config_update(self) -> None:
+        self.config.load_and_update()
+        self.url_handler.reload()
+        self.event_processor.reload()
+        self.media_handler.reload()
+        self.worker_manager.reload()
 
     @classmethod
     def get_config_class(cls) -> Type[BaseProxyConfig]:
@@ -118,15 +126,26 @@ class OrigamiMedia(Plugin):
     @cast(Any, event.on)(EventType.ROOM_MESSAGE)
     async def main(self, event: MaubotMessageEvent) -> None:
         try:
-            if not event.content.msgtype.is_text or event.sender == self.client.mxid:
+            # Redacted or malformed messages carry no msgtype; drop them here
+            # rather than through the exception path.
+            content = event.content
+            msgtype = getattr(content, "msgtype", None)
+            if msgtype is None or not msgtype.is_text:
+                return
+
+            if event.sender == self.client.mxid:
+                return
+
+            body = content.body
+            if not isinstance(body, str):
                 return
 
-            packet = self.event_processor.handle_active(event)
+            packet = self.event_processor.handle_active(event, body)
             if packet:
                 self.worker_manager.spawn_preprocess_worker(packet)
                 return
 
-            packet = self.event_processor.handle_passive(event)
+            packet = self.event_processor.handle_passive(event, body)
             if packet:
                 self.worker_manager.spawn_preprocess_worker(packet)
                 return
@@ -137,5 +156,6 @@ class OrigamiMedia(Plugin):
     async def stop(self) -> None:
         self.log.info("Stopping OrigamiMedia workers...")
         await self.worker_manager.stop()
+        await self.media_handler.close()
         self.log.info("All workers stopped cleanly.")
         await super().stop()
@@ -16,6 +16,8 @@ class CommandType(Enum):
 
 
 class Command:
+    __slots__ = ("name", "type", "description", "modifier")
+
     def __init__(
         self,
         name: str,
@@ -114,6 +116,8 @@ ALIASES = {
 
 
 class CommandPacket:
+    __slots__ = ("command", "event", "user_args", "data", "reaction_id")
+
     def __init__(
         self,
         command: Command,
@@ -1,9 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from io import BytesIO
 from typing import Literal, Optional
 
 
-@dataclass
+@dataclass(slots=True)
 class ProcessedMedia:
     filename: str
     content_info: "MediaInfo"
@@ -18,7 +18,7 @@ class ProcessedMedia:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class MediaInfo:
     url: str
     media_type: str
@@ -39,24 +39,24 @@ class MediaInfo:
     meta_duration: Optional[int] = None  # for thumbnail fallback
 
 
-@dataclass
+@dataclass(slots=True)
 class MediaFile:
     filename: str
     metadata: MediaInfo
-    stream: BytesIO = BytesIO()
+    stream: BytesIO = field(default_factory=BytesIO)
 
     def __del__(self):
         if not self.stream.closed:
             self.stream.close()
 
 
-@dataclass
+@dataclass(slots=True)
 class Media:
     content: MediaFile
     thumbnail: Optional[MediaFile] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class MediaRequest:
     platform_config: dict
     url: str
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import asyncio
-from typing import TYPE_CHECKING, Any, Dict, Optional
+import struct
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, cast
 
 from mautrix.util.ffmpeg import convert_bytes, probe_bytes
 
@@ -12,6 +13,61 @@ if TYPE_CHECKING:
 
     from origami_media.main import Config
 
+# Large payloads are first probed from this many leading bytes; only containers
+# that store their duration in the header are trusted from a partial read.
+_PROBE_HEAD_SIZE = 8 * 1024 * 1024
+_HEADER_DURATION_FORMATS = ("mov,mp4", "matroska")
+
+# JPEG start-of-frame markers; C4, C8 and CC share the range but are not frames.
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    index = 2
+    while index + 9 <= len(data):
+        if data[index] != 0xFF:
+            return None
+        marker = data[index + 1]
+        if marker == 0xFF:
+            index += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            index += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack_from(">HH", data, index + 5)
+            return width, height
+        index += 2 + int.from_bytes(data[index + 2 : index + 4], "big")
+    return None
+
+
+def _image_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    # Reads width and height of still PNG, JPEG and WebP images from their
+    # headers. Anything else, animations included, is left to ffprobe.
+    if (
+        data.startswith(b"\x89PNG\r\n\x1a\n")
+        and data[12:16] == b"IHDR"
+        and len(data) >= 24
+    ):
+        idat = data.find(b"IDAT")
+        if data.find(b"acTL", 0, idat if idat != -1 else len(data)) != -1:
+            return None
+        return struct.unpack_from(">II", data, 16)
+
+    if data.startswith(b"\xff\xd8"):
+        return _jpeg_dimensions(data)
+
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 " and data[23:26] == b"\x9d\x01\x2a":
+            width, height = struct.unpack_from("<HH", data, 26)
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and data[20] == 0x2F:
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+
+    return None
+
 
 class Ffmpeg:
 
@@ -22,6 +78,13 @@ class Ffmpeg:
     async def extract_thumbnail(self, video_data: bytes, format: str = "mp4") -> bytes:
         self.log.info(f"Thumbnail input video data size: {len(video_data)} bytes")
 
+        output_args = ["-frames:v", "1", "-f", "image2pipe", "-vcodec", "png"]
+        max_file_size = self.config.file.get("max_in_memory_file_size", 0)
+        if max_file_size > 0:
+            # Let ffmpeg stop writing once the cap is hit instead of buffering
+            # an oversized frame only to reject it afterwards.
+            output_args = ["-fs", str(max_file_size), *output_args]
+
         thumbnail_data = await convert_bytes(
             data=video_data,
             output_extension="png",
@@ -34,14 +97,16 @@ class Ffmpeg:
                 "-f",
                 format,
             ],
-            output_args=["-frames:v", "1", "-f", "image2pipe", "-vcodec", "png"],
+            output_args=output_args,
             input_mime=f"video/{format}",
             logger=self.log,
         )
 
         self.log.info("Thumbnail successfully extracted")
         if not self._validate_file_size(thumbnail_data):
-            raise
+            raise ValueError(
+                f"Thumbnail size {len(thumbnail_data)} exceeds max_in_memory_file_size"
+            )
 
         return thumbnail_data
 
@@ -68,27 +133,61 @@ class Ffmpeg:
             "pipe:1",
         ]
 
+        max_file_size = self.config.file.get("max_in_memory_file_size", 0)
+        process = None
+        stderr_task = None
         try:
             process = await asyncio.create_subprocess_exec(
                 *ffmpeg_cmd,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
             )
+            stdout_stream = cast(asyncio.StreamReader, process.stdout)
+            stderr_task = asyncio.create_task(
+                self._read_stderr_tail(cast(asyncio.StreamReader, process.stderr))
+            )
 
-            stdout, stderr = await process.communicate()
+            # Read stdout incrementally so an oversized preview is aborted as
+            # soon as it crosses the limit instead of after ffmpeg finishes.
+            parts: List[bytes] = []
+            total_bytes = 0
+            while chunk := await stdout_stream.read(65536):
+                total_bytes += len(chunk)
+                # Same rule as _validate_file_size: a limit of 0 rejects all.
+                if total_bytes > max_file_size:
+                    raise RuntimeError("Livestream preview file size is too large")
+                parts.append(chunk)
+
+            stderr = await stderr_task
+            await process.wait()
 
             if process.returncode != 0:
-                error_message = stderr.decode()
+                error_message = stderr.decode(errors="replace")
                 raise RuntimeError(f"FFmpeg error: {error_message}")
 
-            print("Livestream preview successfully extracted.")
-            if not self._validate_file_size(stdout):
-                raise RuntimeError("Repaired MP4 file size is too large")
-            return stdout
+            self.log.info("Livestream preview successfully extracted.")
+            return b"".join(parts)
 
         except Exception as e:
             raise RuntimeError(f"Failed to capture livestream: {e}")
 
+        finally:
+            if process and process.returncode is None:
+                process.kill()
+                await process.wait()
+            if stderr_task and not stderr_task.done():
+                stderr_task.cancel()
+
+    async def _read_stderr_tail(
+        self, stream: asyncio.StreamReader, limit: int = 8192
+    ) -> bytes:
+        # ffmpeg is chatty on livestreams; only the tail is useful for errors.
+        tail = bytearray()
+        while chunk := await stream.read(65536):
+            tail += chunk
+            del tail[:-limit]
+        return bytes(tail)
+
     async def postprocess_video(self, video_data: bytes) -> bytes:
         self.log.info(f"Post-processing video, input size: {len(video_data)} bytes.")
 
@@ -166,7 +265,23 @@ class Ffmpeg:
             self.log.info(f"Non-numeric duration '{value}' detected. Defaulting to 0.0")
             return 0.0
 
+    def _is_complete_head_probe(self, metadata: Optional[Dict[str, Any]]) -> bool:
+        if not metadata or not metadata.get("streams"):
+            return False
+        format_info = metadata.get("format", {})
+        return format_info.get("format_name", "").startswith(
+            _HEADER_DURATION_FORMATS
+        ) and self._parse_duration(format_info.get("duration")) > 0
+
     async def _probe_metadata(self, data: bytes) -> Optional[Dict[str, Any]]:
+        if len(data) > _PROBE_HEAD_SIZE:
+            try:
+                metadata = await probe_bytes(data[:_PROBE_HEAD_SIZE])
+                if self._is_complete_head_probe(metadata):
+                    return metadata
+            except Exception as e:
+                self.log.debug(f"Head-only probe failed, probing full data: {e}")
+
         metadata = await probe_bytes(data)
         return metadata
 
@@ -183,6 +298,13 @@ class Ffmpeg:
         if not self._validate_file_size(data):
             raise ValueError("File size validation failed.")
 
+        # Still images (mostly thumbnails) are measured in-process instead of
+        # starting an ffprobe subprocess.
+        dimensions = _image_dimensions(data)
+        if dimensions and all(dimensions):
+            width, height = dimensions
+            return FfmpegMetadata(width=width, height=height, duration=0.0)
+
         metadata = await self._probe_metadata(data)
         if not metadata:
             raise ValueError("Failed to probe metadata from the file.")
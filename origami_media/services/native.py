@@ -2,8 +2,14 @@ from __future__ import annotations
 
 import asyncio
 import os
-from io import BytesIO
-from typing import TYPE_CHECKING
+import random
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from aiohttp import ClientTimeout
+
+from origami_media.services.ytdlp import DownloadSizeExceededError
 
 if TYPE_CHECKING:
     from aiohttp import ClientSession
@@ -11,73 +17,150 @@ if TYPE_CHECKING:
 
     from origami_media.main import Config
 
+_IMAGE_ACCEPT_HEADERS = {"Accept": "image/*,*/*;q=0.1"}
+_HEAD_IMAGE_HOST_TTL = 3600  # seconds
+_HEAD_IMAGE_HOST_LIMIT = 256
+
+# Client errors worth another attempt; any other 4xx status is final.
+_TRANSIENT_CLIENT_STATUSES = frozenset({408, 425, 429})
+_MAX_RETRY_DELAY = 30  # seconds
+
+_RIFF_SIGNATURE = (b"RIFF",)  # WEBP, confirmed by the form type at offset 8
+
+# Keyed on the first two bytes so a probe is one dict lookup plus one
+# startswith against the few signatures sharing that prefix.
+_IMAGE_SIGNATURES: Dict[bytes, Tuple[bytes, ...]] = {
+    b"\xFF\xD8": (b"\xFF\xD8\xFF",),  # JPEG
+    b"\x89P": (b"\x89PNG\r\n\x1a\n",),  # PNG
+    b"GI": (b"GIF87a", b"GIF89a"),  # GIF
+    b"II": (b"\x49\x49\x2A\x00",),  # TIFF (little-endian)
+    b"MM": (b"\x4D\x4D\x00\x2A",),  # TIFF (big-endian)
+    b"BM": (b"\x42\x4D",),  # BMP
+    b"\x00\x00": (b"\x00\x00\x01\x00", b"\x00\x00\x02\x00"),  # ICO
+    b"RI": _RIFF_SIGNATURE,
+    b"\x1A\x45": (b"\x1A\x45\xDF\xA3",),  # WebM (EBML Header)
+}
+
 
 class Native:
     def __init__(self, config: "Config", log: "TraceLogger", http: "ClientSession"):
         self.config = config
         self.log = log
         self.http = http
+        self._head_image_hosts: Dict[str, float] = {}
+
+    def _client_timeout(self) -> ClientTimeout:
+        # Pool settings live on the session's connector; only per-request
+        # timeouts are set here.
+        return ClientTimeout(
+            total=None,
+            connect=self.config.http.get("connect_timeout", 10),
+            sock_read=self.config.http.get("sock_read_timeout", 60),
+        )
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after and retry_after.isdigit():
+            return min(_MAX_RETRY_DELAY, int(retry_after))
+        # Exponential backoff with jitter so concurrent retries spread out.
+        return min(_MAX_RETRY_DELAY, 0.5 * 2 ** (attempt - 1) + random.random() * 0.3)
 
     def _is_image_magic_number(self, data: bytes) -> bool:
         """
         Check the first few bytes of a file for common image format signatures.
         """
-        if data.startswith(b"\xFF\xD8\xFF"):  # JPEG
-            return True
-        if data.startswith(b"\x89PNG\r\n\x1a\n"):  # PNG
-            return True
-        if data.startswith(b"GIF87a") or data.startswith(b"GIF89a"):  # GIF
-            return True
-        if data.startswith(b"\x49\x49\x2A\x00") or data.startswith(
-            b"\x4D\x4D\x00\x2A"
-        ):  # TIFF
-            return True
-        if data.startswith(b"\x42\x4D"):  # BMP
-            return True
-        if data.startswith(b"\x00\x00\x01\x00") or data.startswith(
-            b"\x00\x00\x02\x00"
-        ):  # ICO
-            return True
-        if data.startswith(b"RIFF") and b"WEBP" in data:  # WEBP
-            return True
-        if data.startswith(b"\x1A\x45\xDF\xA3"):  # WebM (EBML Header)
-            return True
-
-        return False
+        signatures = _IMAGE_SIGNATURES.get(data[:2])
+        if signatures is None or not data.startswith(signatures):
+            return False
+        if signatures is _RIFF_SIGNATURE:
+            return data[8:12] == b"WEBP"
+        return True
 
     async def is_magic(self, url: str) -> bool:
         try:
-            async with self.http.head(
-                url,
-                allow_redirects=True,
-            ) as response:
-                ctype = response.headers.get("Content-Type", "").lower()
-                self.log.debug(
-                    f"MediaProcessor._is_image: HEAD Content-Type for {url}: {ctype}"
-                )
-                if ctype.startswith("image/"):
-                    return True
-
-            async with self.http.get(url, allow_redirects=True) as response:
-                ctype = response.headers.get("Content-Type", "").lower()
-                if ctype.startswith("image/"):
-                    return True
-
-                # Read the first 12 bytes to check the magic number
-                first_bytes = await response.content.read(12)
-                if self._is_image_magic_number(first_bytes):
-                    return True
-
+            return await asyncio.wait_for(self._probe_image(url), timeout=15)
         except Exception as e:
             self.log.warning(
                 f"MediaProcessor._is_image: Failed to determine if URL is an image ({url}): {e}"
             )
             return False
 
+    async def _probe_image(self, url: str) -> bool:
+        # Hosts whose HEAD recently reported an image get HEAD alone first, so
+        # the common case costs a single request and no body bytes.
+        host = urlsplit(url).hostname or ""
+        expiry = self._head_image_hosts.get(host)
+        if expiry is not None:
+            if expiry > time.monotonic():
+                try:
+                    if await self._head_is_image(url):
+                        return True
+                except Exception as e:
+                    self.log.debug(
+                        f"MediaProcessor._is_image: HEAD failed for {url}: {e}"
+                    )
+                return await self._get_is_image(url)
+            del self._head_image_hosts[host]
+
+        # Otherwise HEAD and GET are sent together; the first one to identify
+        # an image wins and the other request is cancelled.
+        pending = {
+            asyncio.create_task(self._head_is_image(url)),
+            asyncio.create_task(self._get_is_image(url)),
+        }
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        self.log.debug(
+                            f"MediaProcessor._is_image: Probe failed for {url}: {task.exception()}"
+                        )
+                    elif task.result():
+                        return True
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
         return False
 
+    async def _head_is_image(self, url: str) -> bool:
+        async with self.http.head(
+            url,
+            headers=_IMAGE_ACCEPT_HEADERS,
+            allow_redirects=True,
+            timeout=self._client_timeout(),
+        ) as response:
+            ctype = response.headers.get("Content-Type", "").lower()
+            self.log.debug(
+                f"MediaProcessor._is_image: HEAD Content-Type for {url}: {ctype}"
+            )
+            if not ctype.startswith("image/"):
+                return False
+
+        host = urlsplit(url).hostname
+        if host:
+            if len(self._head_image_hosts) >= _HEAD_IMAGE_HOST_LIMIT:
+                self._head_image_hosts.clear()
+            self._head_image_hosts[host] = time.monotonic() + _HEAD_IMAGE_HOST_TTL
+        return True
+
+    async def _get_is_image(self, url: str) -> bool:
+        async with self.http.get(
+            url, allow_redirects=True, timeout=self._client_timeout()
+        ) as response:
+            ctype = response.headers.get("Content-Type", "").lower()
+            if ctype.startswith("image/"):
+                return True
+
+            # Read the first 12 bytes to check the magic number
+            first_bytes = await response.content.read(12)
+            return self._is_image_magic_number(first_bytes)
+
     async def client_download(self, url, platform_config: dict) -> bytes:
-        max_retries = 1
+        max_retries = max(1, self.config.http.get("max_download_attempts", 1))
         max_file_size = self.config.file.get("max_in_memory_file_size", 0)
 
         proxy = None
@@ -95,49 +178,112 @@ class Native:
             f"client_download: Max size limit: {max_file_size} bytes"
         )
 
+        retry_after: Optional[str] = None
+        last_status: Optional[int] = None
+        last_exception: Optional[Exception] = None
+        attempt = 0
         for attempt in range(1, max_retries + 1):
-            try:
-                response = await self.http.get(url, proxy=proxy, headers=headers)
-                if response.status != 200:
-                    self.log.warning(
-                        f"client_download: Attempt {attempt}: {url}: {response.status}"
-                    )
-                    continue
+            if attempt > 1:
+                await asyncio.sleep(self._retry_delay(attempt - 1, retry_after))
+                retry_after = None
 
-                total_bytes = 0
+            try:
+                async with self.http.get(
+                    url,
+                    proxy=proxy,
+                    headers=headers,
+                    raise_for_status=False,
+                    timeout=self._client_timeout(),
+                ) as response:
+                    if response.status != 200:
+                        self.log.warning(
+                            f"client_download: Attempt {attempt}: {url}: {response.status}"
+                        )
+                        last_status = response.status
+                        last_exception = None
+                        if (
+                            400 <= response.status < 500
+                            and response.status not in _TRANSIENT_CLIENT_STATUSES
+                        ):
+                            break
+                        retry_after = response.headers.get("Retry-After")
+                        continue
 
-                output = BytesIO()
-                async for chunk in response.content.iter_chunked(8192):
-                    chunk_size = len(chunk)
-                    total_bytes += chunk_size
+                    total_bytes = 0
+                    content_length = response.content_length
 
-                    if max_file_size > 0 and total_bytes > max_file_size:
+                    # The headers already announce an oversized body, so the
+                    # connection is dropped before any of it is read.
+                    if content_length and 0 < max_file_size < content_length:
                         self.log.error(
-                            f"client_download: Stream size exceeded limit ({total_bytes} > {max_file_size} bytes). Aborting."
+                            f"client_download: Content-Length exceeds limit ({content_length} > {max_file_size} bytes). Aborting."
+                        )
+                        response.close()
+                        raise DownloadSizeExceededError(
+                            "client_download", content_length, max_file_size
                         )
-                        raise
 
-                    output.write(chunk)
+                    parts: List[bytes] = []
+                    parts_append = parts.append
+                    # Chunks are taken as the transport buffered them rather
+                    # than re-sliced to a fixed size.
+                    async for chunk, _ in response.content.iter_chunks():
+                        chunk_len = len(chunk)
 
-                output.seek(0)
-                self.log.info(
-                    f"client_download: Streamed {total_bytes} bytes into memory."
-                )
-                return output.getvalue()
+                        if (
+                            max_file_size > 0
+                            and total_bytes + chunk_len > max_file_size
+                        ):
+                            self.log.error(
+                                f"client_download: Stream size exceeded limit ({total_bytes + chunk_len} > {max_file_size} bytes). Aborting."
+                            )
+                            # Drop the connection instead of letting the rest
+                            # of the body arrive until the response is freed.
+                            response.close()
+                            raise DownloadSizeExceededError(
+                                "client_download",
+                                total_bytes + chunk_len,
+                                max_file_size,
+                            )
+
+                        parts_append(chunk)
+                        total_bytes += chunk_len
+
+                    self.log.info(
+                        f"client_download: Streamed {total_bytes} bytes into memory."
+                    )
+                    return b"".join(parts)
 
+            except DownloadSizeExceededError:
+                raise
             except Exception as e:
                 self.log.warning(
                     f"client_download: Attempt {attempt}: Error streaming data: {e}"
                 )
-
-            await asyncio.sleep(1)
+                last_status = None
+                last_exception = e
 
         self.log.error(
-            f"client_download: Failed to stream data after {max_retries} attempts."
+            f"client_download: Failed to stream data after {attempt} of {max_retries} attempts."
+        )
+        if last_status is not None:
+            raise RuntimeError(f"client_download: {url} returned {last_status}")
+        raise RuntimeError(
+            f"client_download: Failed to stream data from {url}"
+        ) from last_exception
+
+    async def write_to_directory(self, content, directory, file_name) -> bool:
+        return await asyncio.to_thread(
+            self._write_to_directory, content, directory, file_name
         )
-        raise
 
-    def write_to_directory(self, content, directory, file_name):
+    async def read_from_file(self, directory: str, file_name: str) -> str:
+        return await asyncio.to_thread(self._read_from_file, directory, file_name)
+
+    async def file_exists(self, directory: str, file_name: str) -> bool:
+        return await asyncio.to_thread(self._file_exists, directory, file_name)
+
+    def _write_to_directory(self, content, directory, file_name) -> bool:
         if not os.path.exists(directory):
             os.makedirs(directory)
 
@@ -153,7 +299,7 @@ class Native:
             self.log.info(f"An error occurred: {e}")
             return False
 
-    def read_from_file(self, directory: str, file_name: str) -> str:
+    def _read_from_file(self, directory: str, file_name: str) -> str:
         file_path = os.path.join(directory, file_name)
         try:
             with open(file_path, "r") as file:
@@ -167,6 +313,6 @@ class Native:
             self.log.info(f"python: An error occurred: {e}")
             raise e
 
-    def file_exists(self, directory: str, file_name: str) -> bool:
+    def _file_exists(self, directory: str, file_name: str) -> bool:
         file_path = os.path.join(directory, file_name)
         return os.path.isfile(file_path)
@@ -1,11 +1,47 @@
 from __future__ import annotations
 
 import asyncio
-import glob
+import copy
 import json
+import logging
 import os
+import re
 import shlex
-from typing import TYPE_CHECKING, List
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    cast,
+)
+
+try:
+    import orjson  # type: ignore
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    import yt_dlp as _ytdlp_api  # type: ignore
+
+    if not hasattr(_ytdlp_api, "parse_options"):
+        _ytdlp_api = None
+except ImportError:
+    _ytdlp_api = None
+
+# HTTP statuses after which trying another format cannot help.
+_NON_RETRYABLE_ERROR = re.compile(rb"\b(?:401|403|404|410)\b")
+
+_QUERY_CACHE_LIMIT = 128
 
 if TYPE_CHECKING:
     from mautrix.util.logging.trace import TraceLogger
@@ -23,10 +59,94 @@ class DownloadSizeExceededError(Exception):
         self.max_file_size = max_file_size
 
 
+def _decode_error(stderr: bytes) -> str:
+    return stderr.decode("utf-8", "replace").strip() or "No error message captured."
+
+
+@lru_cache(maxsize=32)
+def _parse_ydl_opts(options: Tuple[str, ...]) -> Optional[dict]:
+    # parse_options reports bad options through parser.error(), which raises
+    # SystemExit; None is cached for them so they are not parsed again.
+    try:
+        return _ytdlp_api.parse_options(list(options)).ydl_opts
+    except SystemExit:
+        return None
+
+
+def _extract_info(ydl_opts: dict, url: str) -> dict:
+    # Each run gets its own copy since YoutubeDL may adjust the options it is
+    # given.
+    with _ytdlp_api.YoutubeDL(copy.deepcopy(ydl_opts)) as ydl:
+        info = ydl.extract_info(url, download=False)
+        return ydl.sanitize_info(info)
+
+
+@lru_cache(maxsize=32)
+def _base_argv(
+    cookies_name: Optional[str],
+    user_agent: Optional[str],
+    proxy: Optional[str],
+    extractor_args: Optional[str],
+) -> Tuple[str, ...]:
+    argv = ["yt-dlp", "-q", "--no-warnings"]
+    if cookies_name is not None:
+        argv += ["--cookies", f"/tmp/{cookies_name}-cookies.txt"]
+    if user_agent is not None:
+        argv += ["--user-agent", user_agent]
+    if proxy is not None:
+        argv += ["--proxy", proxy]
+    if extractor_args is not None:
+        argv += ["--extractor-args", extractor_args]
+    return tuple(argv)
+
+
 class Ytdlp:
     def __init__(self, config: "Config", log: "TraceLogger"):
         self.config = config
         self.log = log
+        self._query_cache: Dict[Tuple[Tuple[str, ...], ...], Tuple[float, dict]] = {}
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self._inflight_waiters: Dict[asyncio.Future, int] = {}
+        # In-process probes cannot be interrupted once started, so they get
+        # their own bounded pool; a probe that times out holds one of these
+        # threads instead of the loop's default executor.
+        self._probe_executor = ThreadPoolExecutor(
+            max_workers=max(1, self.config.ytdlp.get("query_concurrency", 3)),
+            thread_name_prefix="ytdlp-probe",
+        )
+
+    async def stop(self) -> None:
+        futures = list(self._inflight.values())
+        for future in futures:
+            future.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
+        self._probe_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _share_inflight(
+        self, key: Tuple, factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        # Identical commands issued while one is already running wait for that
+        # run instead of starting their own. The shared run is shielded so one
+        # caller giving up does not cancel it for the others, and is cancelled
+        # once the last caller has gone so its subprocess is not left behind.
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._forget_inflight(key, future))
+        self._inflight_waiters[future] = self._inflight_waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._inflight_waiters[future] -= 1
+            if not self._inflight_waiters[future]:
+                del self._inflight_waiters[future]
+                self._forget_inflight(key, future)
+                future.cancel()
+
+    def _forget_inflight(self, key: Tuple, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
 
     def create_ytdlp_commands(
         self,
@@ -44,33 +164,31 @@ class Ytdlp:
             raise ValueError(f"No formats set for {platform_config['name']}")
 
         result_commands = []
-        escaped_url = shlex.quote(url)
-        query_flags = "-s -j"
+        query_flags = ["-s", "-j"]
 
         output_arg = f"/tmp/{uuid}"
 
         # Optional configurations
-        proxy = (
-            f"--proxy '{platform_config.get('proxy')}'"
-            if platform_config.get("enable_proxy")
-            else ""
-        )
-        user_agent = (
-            f"--user-agent '{platform_config.get('custom_user_agent')}'"
-            if platform_config.get("enable_custom_user_agent")
-            else ""
-        )
-        cookies = (
-            f"--cookies '/tmp/{platform_config['name']}-cookies.txt'"
-            if platform_config.get("enable_cookies")
-            else ""
+        base_argv = _base_argv(
+            platform_config["name"] if platform_config.get("enable_cookies") else None,
+            (
+                str(platform_config.get("custom_user_agent"))
+                if platform_config.get("enable_custom_user_agent")
+                else None
+            ),
+            (
+                str(platform_config.get("proxy"))
+                if platform_config.get("enable_proxy")
+                else None
+            ),
+            platform_config.get("ytdlp_extractor_args") or None,
         )
 
         if command_type == "query":
             if modifier == "force_audio_only":
                 result_commands.append(
                     {
-                        "command": f"yt-dlp -q --no-warnings {query_flags} {cookies} {user_agent} {proxy} -x {escaped_url}",
+                        "argv": [*base_argv, *query_flags, "-x", url],
                         "selected_format": "audio_only",
                     }
                 )
@@ -82,46 +200,131 @@ class Ytdlp:
                         )
                     result_commands.append(
                         {
-                            "command": f"yt-dlp -q --no-warnings {query_flags} {cookies} {user_agent} {proxy} -f '{format_entry}' {escaped_url}",
+                            "argv": [*base_argv, *query_flags, "-f", format_entry, url],
                             "selected_format": format_entry,
                         }
                     )
 
         elif command_type == "download":
             if modifier == "force_audio_only":
-                output_option = f"-P '{output_arg}'"
                 result_commands.append(
                     {
-                        "command": f"yt-dlp -q --no-warnings {cookies} {user_agent} {proxy} -x --audio-format mp3 --embed-thumbnail {output_option} {escaped_url}",
+                        "argv": [
+                            *base_argv,
+                            "-x",
+                            "--audio-format",
+                            "mp3",
+                            "--embed-thumbnail",
+                            "-P",
+                            output_arg,
+                            url,
+                        ],
                         "selected_format": "audio_only",
                     }
                 )
             else:
                 for format_entry in formats:
-                    output_option = f"-P '{output_arg}'"
+                    # Merged selectors are muxed to stdout as MPEG-TS without
+                    # yt-dlp's fixups, so only single-file formats are streamed.
+                    if "+" in format_entry:
+                        result_commands.append(
+                            {
+                                "argv": [
+                                    *base_argv,
+                                    "-f",
+                                    format_entry,
+                                    "-P",
+                                    output_arg,
+                                    url,
+                                ],
+                                "selected_format": format_entry,
+                            }
+                        )
+                        continue
                     result_commands.append(
                         {
-                            "command": f"yt-dlp -q --no-warnings {cookies} {user_agent} {proxy} -f '{format_entry}' {output_option} {escaped_url}",
+                            "argv": [*base_argv, "-f", format_entry, "-o", "-", url],
                             "selected_format": format_entry,
+                            "to_stdout": True,
                         }
                     )
 
         return result_commands
 
     async def ytdlp_execute_query(self, commands: List[dict]) -> dict:
-        for command_entry in commands:
-            command = command_entry.get("command")
-            format = command_entry.get("selected_format")
+        # Reposts of the same media produce identical commands (YouTube URLs are
+        # already canonical), so successful results are reused for a while.
+        # Live results are not cached since their stream URL goes stale.
+        ttl = self.config.ytdlp.get("query_cache_ttl", 600)
+        key = tuple(tuple(entry.get("argv") or ()) for entry in commands)
+        if ttl > 0:
+            cached = self._query_cache.get(key)
+            if cached is not None:
+                if cached[0] > time.monotonic():
+                    self.log.debug("Using cached yt-dlp query result.")
+                    return cached[1]
+                del self._query_cache[key]
+
+        result = await self._share_inflight(
+            ("query", *key), lambda: self._execute_query(commands)
+        )
 
-            if not command:
-                self.log.warning("Skipping empty command entry.")
-                continue
+        if ttl > 0 and "error" not in result and not result.get("is_live"):
+            if len(self._query_cache) >= _QUERY_CACHE_LIMIT:
+                del self._query_cache[next(iter(self._query_cache))]
+            self._query_cache[key] = (time.monotonic() + ttl, result)
+        return result
+
+    async def _execute_query(self, commands: List[dict]) -> dict:
+        if _ytdlp_api is not None:
+            # Threads cannot be cancelled, so in-process probes run one at a
+            # time and later formats are only tried when earlier ones fail.
+            for command_entry in commands:
+                result = await self._run_query_in_process(command_entry)
+                if result is not None:
+                    return result
+            raise RuntimeError("No valid yt-dlp query command succeeded.")
+
+        # Subprocess probes are independent, so they run concurrently. Results are
+        # still consumed in the configured order, so the first format keeps
+        # priority whenever it succeeds.
+        semaphore = asyncio.Semaphore(
+            max(1, self.config.ytdlp.get("query_concurrency", 3))
+        )
+        tasks = [
+            asyncio.create_task(self._run_query(command_entry, semaphore))
+            for command_entry in commands
+        ]
+
+        try:
+            for task in tasks:
+                result = await task
+                if result is not None:
+                    return result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
-            self.log.info(f"Running yt-dlp command {format} → {command}")
+        raise RuntimeError("No valid yt-dlp query command succeeded.")
+
+    async def _run_query(
+        self, command_entry: dict, semaphore: asyncio.Semaphore
+    ) -> Optional[dict]:
+        argv = command_entry.get("argv")
+        format = command_entry.get("selected_format")
+
+        if not argv:
+            self.log.warning("Skipping empty command entry.")
+            return None
 
+        async with semaphore:
+            self.log.info(f"Running yt-dlp command {format} → {shlex.join(argv)}")
+
+            process = None
             try:
-                process = await asyncio.create_subprocess_shell(
-                    command,
+                process = await asyncio.create_subprocess_exec(
+                    *argv,
                     stdout=asyncio.subprocess.PIPE,
                     stderr=asyncio.subprocess.PIPE,
                 )
@@ -131,40 +334,41 @@ class Ytdlp:
                 )
 
                 if process.returncode != 0:
-                    error_message = (
-                        stderr.decode().strip() or "No error message captured."
-                    )
-                    self.log.warning(f"failed: {error_message}")
+                    non_retryable = _NON_RETRYABLE_ERROR.search(stderr) is not None
+                    error_message = ""
+                    if non_retryable or self.log.isEnabledFor(logging.WARNING):
+                        error_message = _decode_error(stderr)
+                        self.log.warning(f"failed: {error_message}")
 
-                    if any(code in error_message for code in ["403"]):
+                    if non_retryable:
                         self.log.error(
                             "Non-retryable error detected. Stopping retries."
                         )
                         return {"error": error_message}
 
-                    # Skip this command and move to the next
-                    continue
+                    return None
 
-                output = stdout.decode().strip()
-                if not output:
+                if not stdout or stdout.isspace():
                     self.log.warning("Command produced empty output.")
-                    continue
+                    return None
 
-                ytdlp_dict = json.loads(output)
+                ytdlp_dict = _json_loads(stdout)
                 if not ytdlp_dict:
-                    continue
+                    return None
                 ytdlp_dict["selected_format"] = format
 
                 return ytdlp_dict
 
+            except asyncio.CancelledError:
+                raise
+
             except Exception as e:
                 self.log.exception(f"An error occurred: {e}")
-                # Skip this command and move to the next
-                continue
+                return None
 
             finally:
                 if process and process.returncode is None:
-                    self.log.warning("Process still running. Forcing termination.")
+                    self.log.debug("Process still running. Forcing termination.")
                     try:
                         process.kill()
                         await asyncio.wait_for(process.wait(), timeout=5)
@@ -174,7 +378,7 @@ class Ytdlp:
                         )
                     except Exception as e:
                         self.log.exception(
-                            "Unexpected error during process termination: {e}"
+                            f"Unexpected error during process termination: {e}"
                         )
                     finally:
                         if process.returncode is None:
@@ -182,44 +386,128 @@ class Ytdlp:
                                 "Process is stuck and could not be terminated after multiple attempts."
                             )
 
-        raise RuntimeError("No valid yt-dlp query command succeeded.")
+    async def _run_query_in_process(self, command_entry: dict) -> Optional[dict]:
+        argv = command_entry.get("argv")
+        format = command_entry.get("selected_format")
+
+        if not argv:
+            self.log.warning("Skipping empty command entry.")
+            return None
+
+        self.log.info(f"Running yt-dlp command {format} → {shlex.join(argv)}")
+
+        # Option parsing only depends on the flags, which repeat for every URL of
+        # a platform and format; the URL is always the last argument.
+        ydl_opts = _parse_ydl_opts(tuple(argv[1:-1]))
+        if ydl_opts is None:
+            # Every format shares the failing options, so retrying cannot help.
+            error_message = "yt-dlp rejected the configured options."
+            self.log.error(error_message)
+            return {"error": error_message}
+
+        # Same options as the CLI invocation, but extracted in a worker thread
+        # of this process instead of paying a fresh interpreter start-up.
+        loop = asyncio.get_running_loop()
+        try:
+            ytdlp_dict = await asyncio.wait_for(
+                loop.run_in_executor(
+                    self._probe_executor, _extract_info, ydl_opts, argv[-1]
+                ),
+                timeout=30,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error_message = str(e) or "No error message captured."
+            self.log.warning(f"failed: {error_message}")
+
+            if _NON_RETRYABLE_ERROR.search(error_message.encode()):
+                self.log.error("Non-retryable error detected. Stopping retries.")
+                return {"error": error_message}
+
+            return None
+
+        if not ytdlp_dict:
+            return None
+        ytdlp_dict["selected_format"] = format
+
+        return ytdlp_dict
 
     async def ytdlp_execute_download(self, commands: List[dict], uuid: str) -> bytes:
-        last_exception = None
+        # Commands that write to disk name a per-request directory in their
+        # argv, so only stdout downloads of the same media are ever shared.
+        key = ("download", *(tuple(entry.get("argv") or ()) for entry in commands))
+        return await self._share_inflight(key, lambda: self._download(commands, uuid))
+
+    async def _download(self, commands: List[dict], uuid: str) -> bytes:
+        # Audio extraction and merged formats write to disk; the scratch
+        # directory is created once and removed once, however many attempts
+        # are made.
         download_dir = f"/tmp/{uuid}/"
+        uses_disk = any(not entry.get("to_stdout") for entry in commands)
+        if uses_disk:
+            await asyncio.to_thread(os.makedirs, download_dir, exist_ok=True)
+        try:
+            return await self._execute_downloads(commands, download_dir)
+        finally:
+            if uses_disk:
+                await asyncio.to_thread(
+                    shutil.rmtree, download_dir, ignore_errors=True
+                )
+                self.log.debug(f"Cleaned up directory {download_dir}")
+
+    async def _execute_downloads(
+        self, commands: List[dict], download_dir: str
+    ) -> bytes:
+        last_exception = None
+        max_file_size = self.config.file.get("max_in_memory_file_size", 0)
 
         for command_entry in commands:
-            command = command_entry.get("command")
+            argv = command_entry.get("argv")
             format = command_entry.get("selected_format")
+            to_stdout = command_entry.get("to_stdout", False)
 
-            if not command:
+            if not argv:
                 self.log.warning("Skipping empty download command.")
                 continue
 
+            command = shlex.join(argv)
             self.log.info(f"Executing yt-dlp download command {format} → {command}")
 
             process = None
+            stderr_task = None
             try:
-                if not os.path.exists(download_dir):
-                    os.makedirs(download_dir, exist_ok=True)
-
-                process = await asyncio.create_subprocess_shell(
-                    command,
+                if not to_stdout:
+                    # A failed attempt can leave finished streams behind, such
+                    # as one half of a merged format, which the next attempt
+                    # would otherwise read back.
+                    await asyncio.to_thread(self._clear_directory, download_dir)
+
+                process = await asyncio.create_subprocess_exec(
+                    *argv,
                     stdout=asyncio.subprocess.PIPE,
                     stderr=asyncio.subprocess.PIPE,
                     limit=1024 * 1024 * 10,
                 )
 
-                stdout, stderr = await process.communicate()
+                if to_stdout:
+                    # stderr is drained alongside stdout so a full stderr pipe
+                    # can never stall yt-dlp mid-download.
+                    stderr_task = asyncio.create_task(
+                        cast(asyncio.StreamReader, process.stderr).read()
+                    )
+                    video_data = await self._read_stdout(process, max_file_size)
+                    stderr = await stderr_task
+                    await process.wait()
+                else:
+                    _, stderr = await process.communicate()
 
                 if process.returncode != 0:
-                    error_message = (
-                        stderr.decode().strip() or "No error message captured."
-                    )
-                    self.log.warning(f"Download failed: {error_message}")
+                    if self.log.isEnabledFor(logging.WARNING):
+                        self.log.warning(f"Download failed: {_decode_error(stderr)}")
 
                     # Non-retryable error handling
-                    if any(code in error_message for code in ["403"]):
+                    if _NON_RETRYABLE_ERROR.search(stderr):
                         self.log.error(
                             "Non-retryable error detected. Stopping retries."
                         )
@@ -229,43 +517,28 @@ class Ytdlp:
                         f"Download failed with return code {process.returncode}."
                     )
 
-                # Locate the downloaded file
-                downloaded_files = glob.glob(os.path.join(download_dir, "*"))
-                if not downloaded_files:
-                    raise FileNotFoundError(f"No files found in {download_dir}")
+                if to_stdout:
+                    if not video_data:
+                        raise RuntimeError("yt-dlp produced no output.")
+                    self.log.info(f"Downloaded file size: {len(video_data)} bytes")
+                    return video_data
 
-                if len(downloaded_files) > 1:
-                    raise RuntimeError(
-                        f"Multiple files found in {download_dir}, unable to determine correct file: {downloaded_files}"
-                    )
-
-                file_path = downloaded_files[0]
-                self.log.info(f"Located downloaded file: {file_path}")
-
-                # Read the file content as bytes
-                with open(file_path, "rb") as f:
-                    video_data = f.read()
+                # Disk downloads are post-processed by yt-dlp, so read the file back
+                video_data = await asyncio.to_thread(
+                    self._read_downloaded_file, download_dir
+                )
 
                 self.log.info(f"Downloaded file size: {len(video_data)} bytes")
                 return video_data
 
+            except DownloadSizeExceededError:
+                raise
+
             except Exception as e:
                 self.log.exception(f"An error occurred with command {command}: {e}")
                 last_exception = e
 
             finally:
-                if os.path.exists(download_dir):
-                    try:
-                        for file in os.listdir(download_dir):
-                            file_path = os.path.join(download_dir, file)
-                            os.remove(file_path)
-                        os.rmdir(download_dir)
-                        self.log.debug(f"Cleaned up directory {download_dir}")
-                    except Exception as cleanup_error:
-                        self.log.warning(
-                            f"Failed to clean up {download_dir}: {cleanup_error}"
-                        )
-
                 if process and process.returncode is None:
                     self.log.warning("Process still running. Forcing termination.")
                     process.kill()
@@ -283,9 +556,61 @@ class Ytdlp:
                                 "Process is stuck and could not be terminated."
                             )
 
+                if stderr_task and not stderr_task.done():
+                    stderr_task.cancel()
+
         if last_exception:
             raise RuntimeError(
                 "No valid yt-dlp download command succeeded. See logs for details."
             ) from last_exception
         else:
             raise RuntimeError("No valid yt-dlp download command succeeded.")
+
+    def _clear_directory(self, download_dir: str) -> None:
+        with os.scandir(download_dir) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+
+    def _read_downloaded_file(self, download_dir: str) -> bytes:
+        with os.scandir(download_dir) as entries:
+            downloaded_files = [
+                entry.path
+                for entry in entries
+                if entry.is_file() and not entry.name.endswith((".part", ".ytdl"))
+            ]
+        if not downloaded_files:
+            raise FileNotFoundError(f"No files found in {download_dir}")
+
+        if len(downloaded_files) > 1:
+            raise RuntimeError(
+                f"Multiple files found in {download_dir}, unable to determine correct file: {downloaded_files}"
+            )
+
+        file_path = downloaded_files[0]
+        self.log.info(f"Located downloaded file: {file_path}")
+
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    async def _read_stdout(
+        self, process: asyncio.subprocess.Process, max_file_size: int
+    ) -> bytes:
+        stdout = cast(asyncio.StreamReader, process.stdout)
+        parts: List[bytes] = []
+        total_bytes = 0
+        while True:
+            chunk = await stdout.read(1 << 20)
+            if not chunk:
+                break
+            total_bytes += len(chunk)
+            if max_file_size > 0 and total_bytes > max_file_size:
+                # Kill yt-dlp right away so it stops pulling bytes from the
+                # server instead of waiting for the cleanup in the caller.
+                process.kill()
+                await process.wait()
+                raise DownloadSizeExceededError("yt-dlp", total_bytes, max_file_size)
+            parts.append(chunk)
+        return b"".join(parts)
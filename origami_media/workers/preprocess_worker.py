@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import asyncio
-from typing import TYPE_CHECKING, Set
+from typing import TYPE_CHECKING, Optional
 
 from origami_media.models.command_models import CommandPacket
 
@@ -17,44 +17,33 @@ class PreprocessWorker:
         self,
         log: "TraceLogger",
         config: "Config",
-        preprocess_lock: asyncio.Lock,
-        preprocess_tasks: Set,
-        event_queue: asyncio.Queue,
+        preprocess_semaphore: asyncio.Semaphore,
         command_handler: "CommandHandler",
     ):
         self.log = log
         self.config = config
-        self.preprocess_lock = preprocess_lock
-        self.preprocess_tasks = preprocess_tasks
-        self.event_queue = event_queue
+        self.preprocess_semaphore = preprocess_semaphore
         self.command_handler = command_handler
+        self.reload()
 
-    async def preprocess(self, packet: CommandPacket) -> None:
-        self.preprocess_tasks.add(packet.event.event_id)
-        allowed = await self._is_allowed()
-        if not allowed:
+    def reload(self) -> None:
+        self.preprocess_worker_limit = self.config.queue.get(
+            "preprocess_worker_limit", 10
+        )
+
+    async def preprocess(self, packet: CommandPacket) -> Optional[CommandPacket]:
+        if self.preprocess_semaphore.locked():
             self.log.warning(
-                f"Skipping preprocess task for {packet.event.event_id}: "
-                f"Active preprocess task limit reached ({len(self.preprocess_tasks)}/"
-                f"{self.config.queue.get('preprocess_worker_limit')}."
+                "Skipping preprocess task for %s: "
+                "Active preprocess task limit reached (%s).",
+                packet.event.event_id,
+                self.preprocess_worker_limit,
             )
-            return
-        try:
-            preprocessed_packet = await self.command_handler.handle_preprocess(packet)
-            if preprocessed_packet:
-                self.event_queue.put_nowait(packet)
-        except asyncio.QueueFull:
-            self.log.warning("Message queue is full. Dropping incoming message.")
-        except Exception as e:
-            self.log.error(f"Unexpected error: {e}")
-        finally:
-            self.preprocess_tasks.discard(packet.event.event_id)
-
-    async def _is_allowed(self) -> bool:
-        async with self.preprocess_lock:
-            if len(self.preprocess_tasks) > self.config.queue.get(
-                "preprocess_worker_limit", 10
-            ):
-                return False
-            else:
-                return True
+            return None
+
+        async with self.preprocess_semaphore:
+            try:
+                return await self.command_handler.handle_preprocess(packet)
+            except Exception as e:
+                self.log.error("Unexpected error: %s", e)
+                return None
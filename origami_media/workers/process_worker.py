@@ -19,21 +19,39 @@ class ProcessWorker:
         log: "TraceLogger",
         config: "Config",
         client: "MaubotMatrixClient",
-        event_queue: asyncio.Queue,
+        process_semaphore: asyncio.Semaphore,
         ROUTE_EXECUTION_TIMEOUT,
         command_handler: "CommandHandler",
     ):
         self.log = log
         self.config = config
         self.client = client
-        self.event_queue = event_queue
+        self.process_semaphore = process_semaphore
         self.ROUTE_EXECUTION_TIMEOUT = ROUTE_EXECUTION_TIMEOUT
         self.command_handler = command_handler
+        self.pending_count = 0
+        self.reload()
 
-    async def process(self) -> None:
-        while True:
-            try:
-                packet: CommandPacket = await self.event_queue.get()
+    def reload(self) -> None:
+        self.event_queue_capacity = self.config.queue.get("event_queue_capacity", 10)
+
+    async def process(self, packet: CommandPacket) -> None:
+        # Runs the process stage inline in the caller's task. The semaphore caps
+        # how many packets are processed at once; pending_count bounds how many
+        # admitted packets may wait for a slot.
+        if self.pending_count >= self.event_queue_capacity:
+            self.log.warning("Message queue is full. Dropping incoming message.")
+            return
+
+        # The slot is held from here on, so everything up to acquiring the
+        # semaphore sits inside the try that gives it back.
+        self.pending_count += 1
+        acquired = False
+        try:
+            await self.command_handler.acknowledge(packet)
+            async with self.process_semaphore:
+                acquired = True
+                self.pending_count -= 1
                 try:
                     await asyncio.wait_for(
                         self.command_handler.handle_process(packet),
@@ -42,19 +60,12 @@ class ProcessWorker:
                 except asyncio.TimeoutError:
                     self.log.warning("Timeout while executing command execution.")
                 except Exception as e:
-                    self.log.error(f"Error during command execution: {e}")
-
-            except asyncio.TimeoutError:
-                self.log.warning(
-                    "Worker timed out waiting for new event. Continuing..."
-                )
-
-            except asyncio.CancelledError:
-                self.log.info("[Worker] Shutting down gracefully.")
-                raise
+                    self.log.error("Error during command execution: %s", e)
 
-            except Exception as e:
-                self.log.error(f"[Worker] Unexpected error: {e}")
+        except asyncio.CancelledError:
+            self.log.info("[Worker] Shutting down gracefully.")
+            raise
 
-            finally:
-                self.event_queue.task_done()
+        finally:
+            if not acquired:
+                self.pending_count -= 1
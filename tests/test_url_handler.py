@@ -0,0 +1,30 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+# Importing any module of the plugin loads origami_media/__init__, which needs
+# the maubot runtime (maubot, mautrix); without it these tests are skipped.
+pytest.importorskip("maubot")
+
+from origami_media.handlers.url_handler import UrlHandler  # noqa: E402
+
+
+@pytest.fixture
+def url_handler():
+    config = SimpleNamespace(meta={}, queue={}, platform_domains=set())
+    return UrlHandler(config=config, log=logging.getLogger(__name__))
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42",
+        "https://www.youtube.com/watch?t=42&v=dQw4w9WgXcQ",
+    ],
+)
+def test_youtube_timestamp_in_either_order(url_handler, url):
+    assert url_handler._process_youtube_url(url) == (
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42",
+        False,
+    )